@@ -19,7 +19,7 @@ from __future__ import annotations
 import argparse
 import dataclasses
 import datetime as _dt
-import io
+import functools
 import math
 import os
 import re
@@ -28,6 +28,14 @@ from typing import List, Optional, Tuple
 
 # ---- TOML parsing (values and file validation) ------------------------------
 
+try:
+    # Optional accelerator for the value-block scanner; the tool remains
+    # fully functional (stdlib-only) when numba/numpy are absent.
+    import numpy as _np
+    from numba import njit as _njit
+except ModuleNotFoundError:
+    _np = None
+
 try:
     import tomllib  # Python 3.11+
 except ModuleNotFoundError:
@@ -39,11 +47,40 @@ except ModuleNotFoundError:
     sys.exit(4)
 
 
+# Conservative scalar shapes that can bypass tomllib entirely; anything not
+# matched exactly (underscores, leading zeros, datetimes, escapes, ...) falls
+# through to the full parser.
+_SIMPLE_INT_RE = re.compile(r"^[+-]?(?:0|[1-9]\d*)$")
+_SIMPLE_FLOAT_RE = re.compile(r"^[+-]?(?:0|[1-9]\d*)(?:\.\d+(?:[eE][+-]?\d+)?|[eE][+-]?\d+)$")
+# Raw control characters (all but tab) are invalid inside quoted TOML strings;
+# the fast paths must hand them to tomllib so they are rejected as before.
+_RAW_CTRL_RE = re.compile(r"[\x00-\x08\x0a-\x1f\x7f]")
+
+
+@functools.lru_cache(maxsize=256)
 def parse_toml_value(value_src: str):
     """
-    Parse a TOML literal from a 'key = VALUE' snippet using tomllib.
-    Raise ValueError on parse errors.
+    Parse a TOML literal from a 'key = VALUE' snippet, short-circuiting the
+    common scalar cases (int, float, bool, plain quoted string) without
+    invoking tomllib. Raise ValueError on parse errors.
+
+    Results are cached by source string; callers must treat them as
+    immutable.
     """
+    v = value_src.strip()
+    if v == "true":
+        return True
+    if v == "false":
+        return False
+    if _SIMPLE_INT_RE.match(v):
+        return int(v)
+    if _SIMPLE_FLOAT_RE.match(v):
+        return float(v)
+    if len(v) >= 2 and _RAW_CTRL_RE.search(v) is None:
+        if v[0] == '"' and v[-1] == '"' and "\\" not in v and '"' not in v[1:-1]:
+            return v[1:-1]
+        if v[0] == "'" and v[-1] == "'" and "'" not in v[1:-1]:
+            return v[1:-1]
     snippet = f"__k__ = {value_src}\n"
     try:
         obj = tomllib.loads(snippet)
@@ -64,172 +101,193 @@ def validate_toml_document(text: str) -> None:
 _BARE_KEY_RE = re.compile(r"^[A-Za-z0-9_-]+$")
 
 
+# Precomputed so the per-character escape scan runs inside CPython's C loop.
+_ESCAPE_TABLE = str.maketrans({
+    "\\": "\\\\",
+    '"': '\\"',
+    "\b": "\\b",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+# Fast-path detector: most real-world values need no escaping at all.
+_SPECIAL_RE = re.compile(r'[\\"\x00-\x1f]')
+
+
 def _escape_string(s: str) -> str:
-    out = []
-    for ch in s:
-        if ch == "\\":
-            out.append("\\\\")
-        elif ch == '"':
-            out.append('\\"')
-        elif ch == "\b":
-            out.append("\\b")
-        elif ch == "\t":
-            out.append("\\t")
-        elif ch == "\n":
-            out.append("\\n")
-        elif ch == "\r":
-            out.append("\\r")
-        else:
-            out.append(ch)
-    return '"' + "".join(out) + '"'
+    if _SPECIAL_RE.search(s) is None:
+        return '"' + s + '"'
+    return '"' + s.translate(_ESCAPE_TABLE) + '"'
 
 
 def _format_key_segment(seg: str) -> str:
     return seg if _BARE_KEY_RE.match(seg) else _escape_string(seg)
 
 
-def format_toml_value(obj) -> str:
+def _emit_toml_value(obj, out: List[str]) -> None:
+    # Append the rendering of obj to out; one final join in format_toml_value
+    # replaces the per-level intermediate strings of a recursive formatter.
     if isinstance(obj, bool):
-        return "true" if obj else "false"
-    if isinstance(obj, int) and not isinstance(obj, bool):
-        return str(obj)
+        out.append("true" if obj else "false")
+        return
+    if isinstance(obj, int):
+        out.append(str(obj))
+        return
     if isinstance(obj, float):
         if math.isnan(obj):
-            return "nan"
+            out.append("nan")
+            return
         if math.isinf(obj):
-            return "inf" if obj > 0 else "-inf"
-        return repr(obj) if ("e" in repr(obj).lower()) else str(obj)
+            out.append("inf" if obj > 0 else "-inf")
+            return
+        out.append(repr(obj) if ("e" in repr(obj).lower()) else str(obj))
+        return
     if isinstance(obj, str):
-        return _escape_string(obj)
-    if isinstance(obj, _dt.datetime):
-        return obj.isoformat()
-    if isinstance(obj, _dt.date):
-        return obj.isoformat()
-    if isinstance(obj, _dt.time):
-        return obj.isoformat()
+        out.append(_escape_string(obj))
+        return
+    if isinstance(obj, (_dt.datetime, _dt.date, _dt.time)):
+        out.append(obj.isoformat())
+        return
     if isinstance(obj, dict):
-        parts = []
-        for k, v in obj.items():
-            parts.append(f"{_format_key_segment(k)} = {format_toml_value(v)}")
-        return "{ " + ", ".join(parts) + " }"
+        out.append("{ ")
+        for i, (k, v) in enumerate(obj.items()):
+            if i:
+                out.append(", ")
+            out.append(_format_key_segment(k))
+            out.append(" = ")
+            _emit_toml_value(v, out)
+        out.append(" }")
+        return
     if isinstance(obj, (list, tuple)):
-        return "[" + ", ".join(format_toml_value(v) for v in obj) + "]"
-    return _escape_string(str(obj))
+        out.append("[")
+        for i, v in enumerate(obj):
+            if i:
+                out.append(", ")
+            _emit_toml_value(v, out)
+        out.append("]")
+        return
+    out.append(_escape_string(str(obj)))
+
+
+def format_toml_value(obj) -> str:
+    out: List[str] = []
+    _emit_toml_value(obj, out)
+    return "".join(out)
 
 
 # ---- CLI patch specification parsing ----------------------------------------
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class PathSegment:
     name: str
     index: Optional[int] = None  # for arrays-of-tables, applies to that table segment
+    # Derived (name, index) tuple so hot loops compare segments with a single
+    # C-level tuple comparison; names are interned for the identity shortcut.
+    _key: Tuple[str, Optional[int]] = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "name", sys.intern(self.name))
+        object.__setattr__(self, "_key", (self.name, self.index))
 
     def as_string(self) -> str:
         base = self.name
         return f"{base}[{self.index}]" if self.index is not None else base
 
 
-def _split_path_tokens(raw: str) -> List[str]:
+def _split_path_tokens(raw: str) -> List[Tuple[str, Optional[int]]]:
     """
-    Split a dotted path into segments, respecting quoted keys and [index] suffix.
-    Example: '"my.key".child[2].grand' -> ['"my.key"', 'child[2]', 'grand']
+    Split a dotted path into (raw_segment, index) pairs in a single scan,
+    respecting quoted keys and a trailing [N] suffix per segment.
+    Example: '"my.key".child[2].grand' -> [('"my.key"', None), ('child', 2), ('grand', None)]
     """
     s = raw.strip()
-    out: List[str] = []
+    out: List[Tuple[str, Optional[int]]] = []
     i, n = 0, len(s)
-    buf = io.StringIO()
-    in_dq = False
-    in_sq = False
+    start = 0
+    idx: Optional[int] = None  # pending [N] suffix of the current segment
+    name_end = -1  # where the segment name stops once a [N] suffix is seen
     while i < n:
         ch = s[i]
-        if in_dq:
-            buf.write(ch)
-            if ch == "\\":
-                i += 1
-                if i < n:
-                    buf.write(s[i])
-            elif ch == '"':
-                in_dq = False
-            i += 1
-            continue
-        if in_sq:
-            buf.write(ch)
-            if ch == "'":
-                in_sq = False
-            i += 1
-            continue
         if ch == '"':
-            in_dq = True
-            buf.write(ch)
-            i += 1
+            # Jump to the closing quote, honoring backslash escapes.
+            j = s.find('"', i + 1)
+            while j != -1:
+                bs = 0
+                while s[j - bs - 1] == "\\":
+                    bs += 1
+                if bs % 2 == 0:
+                    break
+                j = s.find('"', j + 1)
+            i = n if j == -1 else j + 1
             continue
         if ch == "'":
-            in_sq = True
-            buf.write(ch)
-            i += 1
+            j = s.find("'", i + 1)
+            i = n if j == -1 else j + 1
             continue
-        if ch == ".":
-            out.append(buf.getvalue().strip())
-            buf = io.StringIO()
+        if ch == "[" and i > start:
+            # Only a [digits] run that closes the segment is an index;
+            # anything else stays part of the segment name.
+            j = s.find("]", i + 1)
+            if j != -1 and s[i + 1 : j].isdigit():
+                k = j + 1
+                while k < n and s[k] in " \t":
+                    k += 1
+                if k == n or s[k] == ".":
+                    idx = int(s[i + 1 : j])
+                    name_end = i
+                    i = j + 1
+                    continue
             i += 1
             continue
-        buf.write(ch)
+        if ch == ".":
+            seg = s[start : name_end if idx is not None else i].strip()
+            out.append((seg, idx))
+            idx = None
+            name_end = -1
+            start = i + 1
         i += 1
-    final = buf.getvalue().strip()
-    if final != "":
-        out.append(final)
+    final = s[start : name_end if idx is not None else n].strip()
+    if final != "" or idx is not None:
+        out.append((final, idx))
     return out
 
 
+_UNESCAPE_MAP = {
+    '"': '"',
+    "\\": "\\",
+    "b": "\b",
+    "t": "\t",
+    "n": "\n",
+    "r": "\r",
+}
+_ESCAPE_SEQ_RE = re.compile(r"\\(.)", re.DOTALL)
+
+
 def _unquote_key(tok: str) -> str:
     tok = tok.strip()
     if tok.startswith('"') and tok.endswith('"'):
         body = tok[1:-1]
-        out = []
-        i = 0
-        while i < len(body):
-            ch = body[i]
-            if ch == "\\":
-                i += 1
-                if i < len(body):
-                    esc = body[i]
-                    mapping = {
-                        '"': '"',
-                        "\\": "\\",
-                        "b": "\b",
-                        "t": "\t",
-                        "n": "\n",
-                        "r": "\r",
-                    }
-                    out.append(mapping.get(esc, esc))
-            else:
-                out.append(ch)
-            i += 1
-        return "".join(out)
+        if "\\" not in body:
+            return body
+        return _ESCAPE_SEQ_RE.sub(
+            lambda m: _UNESCAPE_MAP.get(m.group(1), m.group(1)), body
+        )
     if tok.startswith("'") and tok.endswith("'"):
         return tok[1:-1]
     return tok
 
 
-_INDEX_RE = re.compile(r"^(?P<name>.+?)\[(?P<idx>\d+)\]$")
-
-
-def parse_path_with_indices(path: str) -> List[PathSegment]:
-    toks = _split_path_tokens(path)
-    segs: List[PathSegment] = []
-    for t in toks:
-        t = t.strip()
-        m = _INDEX_RE.match(t)
-        if m:
-            name = _unquote_key(m.group("name").strip())
-            idx = int(m.group("idx"))
-            segs.append(PathSegment(name=name, index=idx))
-        else:
-            name = _unquote_key(t)
-            segs.append(PathSegment(name=name, index=None))
-    return segs
+@functools.lru_cache(maxsize=256)
+def parse_path_with_indices(path: str) -> Tuple[PathSegment, ...]:
+    return tuple(
+        PathSegment(name=_unquote_key(name_raw), index=idx)
+        for name_raw, idx in _split_path_tokens(path)
+    )
 
 
+@functools.lru_cache(maxsize=256)
 def split_set_expression(s: str) -> Tuple[str, str, Optional[str]]:
     """
     Split a --set STRING of the form:
@@ -239,19 +297,22 @@ def split_set_expression(s: str) -> Tuple[str, str, Optional[str]]:
     # Find '=' outside quotes
     i = 0
     n = len(s)
-    in_dq = in_sq = False
     eq_pos = -1
     while i < n:
         ch = s[i]
-        if ch == '"' and not in_sq:
-            in_dq = not in_dq
-            i += 1
+        if ch == '"':
+            j = s.find('"', i + 1)
+            if j == -1:
+                break
+            i = j + 1
             continue
-        if ch == "'" and not in_dq:
-            in_sq = not in_sq
-            i += 1
+        if ch == "'":
+            j = s.find("'", i + 1)
+            if j == -1:
+                break
+            i = j + 1
             continue
-        if ch == "=" and not in_dq and not in_sq:
+        if ch == "=":
             eq_pos = i
             break
         i += 1
@@ -266,19 +327,22 @@ def split_set_expression(s: str) -> Tuple[str, str, Optional[str]]:
     # Find '#' not in quotes for inline comment
     i = 0
     n = len(rhs)
-    in_dq = in_sq = False
     hash_pos = -1
     while i < n:
         ch = rhs[i]
-        if ch == '"' and not in_sq:
-            in_dq = not in_dq
-            i += 1
+        if ch == '"':
+            j = rhs.find('"', i + 1)
+            if j == -1:
+                break
+            i = j + 1
             continue
-        if ch == "'" and not in_dq:
-            in_sq = not in_sq
-            i += 1
+        if ch == "'":
+            j = rhs.find("'", i + 1)
+            if j == -1:
+                break
+            i = j + 1
             continue
-        if ch == "#" and not in_dq and not in_sq:
+        if ch == "#":
             hash_pos = i
             break
         i += 1
@@ -298,7 +362,7 @@ def split_set_expression(s: str) -> Tuple[str, str, Optional[str]]:
 
 # ---- Source document scanning and edits -------------------------------------
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Header:
     # Represents either a normal table [a.b] or an array-of-tables [[a.b]]
     kind: str  # 'table' or 'aot' or 'root'
@@ -306,41 +370,46 @@ class Header:
     aot_index: Optional[int]  # only for kind == 'aot', 0-based
     start_line: int  # header line index (for root: -1)
     end_line: int    # inclusive; set later
+    # Precomputed by index_headers: id_segments() as (name, index) keys, so
+    # section scans never rebuild segment lists per lookup.
+    id_keys: Tuple[Tuple[str, Optional[int]], ...] = ()
 
-    def id_segments(self) -> List[PathSegment]:
+    def id_segments(self) -> Tuple[PathSegment, ...]:
         if self.kind == 'aot':
-            return [PathSegment(name=s) for s in self.path[:-1]] + [PathSegment(self.path[-1], self.aot_index)]
+            return tuple(PathSegment(name=s) for s in self.path[:-1]) + (PathSegment(self.path[-1], self.aot_index),)
         elif self.kind == 'table':
-            return [PathSegment(name=s) for s in self.path]
+            return tuple(PathSegment(name=s) for s in self.path)
         else:
-            return []  # root
+            return ()  # root
 
-    def dotted(self) -> str:
-        segs = []
-        for seg in self.id_segments():
-            segs.append(seg.as_string())
-        return ".".join(segs)
 
-
-_HEADER_TABLE_RE = re.compile(r"^\s*\[(?!\[)(?P<body>.+?)\]\s*(?:#.*)?$")
-_HEADER_AOT_RE = re.compile(r"^\s*\[\[(?P<body>.+?)\]\]\s*(?:#.*)?$")
+# Single alternation for both [table] and [[array-of-tables]] headers; the
+# bracket groups distinguish the two kinds in one regex pass per line.
+_HEADER_RE = re.compile(r"^\s*(?P<open>\[\[?)(?P<body>.+?)(?P<close>\]\]?)\s*(?:#.*)?$")
 
 
 def _parse_header_line(line: str) -> Optional[Tuple[str, List[str]]]:
-    m = _HEADER_TABLE_RE.match(line)
-    if m:
-        body = m.group("body").strip()
-        return "table", [_unquote_key(tok) for tok in _split_path_tokens(body)]
-    m = _HEADER_AOT_RE.match(line)
-    if m:
-        body = m.group("body").strip()
-        return "aot", [_unquote_key(tok) for tok in _split_path_tokens(body)]
-    return None
+    m = _HEADER_RE.match(line)
+    if not m or len(m.group("open")) != len(m.group("close")):
+        return None
+    body = m.group("body").strip()
+    kind = "aot" if m.group("open") == "[[" else "table"
+    return kind, [_unquote_key(tok) for tok, _idx in _split_path_tokens(body)]
+
+
+def _first_nonspace(line: str) -> int:
+    # Index of the first non-blank character; avoids the throwaway string an
+    # lstrip()/strip() would allocate just to classify the line.
+    i = 0
+    n = len(line)
+    while i < n and line[i] in " \t":
+        i += 1
+    return i
 
 
 def _is_comment_or_blank(line: str) -> bool:
-    s = line.strip()
-    return (not s) or s.startswith("#")
+    i = _first_nonspace(line)
+    return i >= len(line) or line[i] in "#\r\n"
 
 
 def index_headers(lines: List[str]) -> List[Header]:
@@ -350,6 +419,8 @@ def index_headers(lines: List[str]) -> List[Header]:
     root = Header(kind="root", path=[], aot_index=None, start_line=-1, end_line=-1)
     headers.append(root)
     for i, line in enumerate(lines):
+        if "[" not in line:  # cheap C-level prefilter before the regex
+            continue
         parsed = _parse_header_line(line)
         if not parsed:
             continue
@@ -374,49 +445,101 @@ def index_headers(lines: List[str]) -> List[Header]:
         while j > h.start_line and _is_comment_or_blank(lines[j]):
             j -= 1
         h.end_line = j
+    for h in headers:
+        h.id_keys = _segments_key(h.id_segments())
     return headers
 
 
-def _segments_equal(a: List[PathSegment], b: List[PathSegment]) -> bool:
-    if len(a) != len(b):
-        return False
-    for sa, sb in zip(a, b):
-        if sa.name != sb.name:
-            return False
-        if sa.index != sb.index:
-            return False
-    return True
+@dataclasses.dataclass(slots=True)
+class HeaderIndex:
+    """
+    Cached view of the section headers of a document, kept in sync with the
+    line buffer across patches so each patch does not re-scan the whole file.
+    """
+    lines: List[str]
+    headers: List[Header]
+    # O(1) lookup tables over headers: (kind, path, aot_index) -> Header, and
+    # path -> all aot headers with that path (for ambiguity detection).
+    by_path: dict
+    aot_by_path: dict
+
+    @classmethod
+    def build(cls, lines: List[str]) -> "HeaderIndex":
+        index = cls(lines=lines, headers=[], by_path={}, aot_by_path={})
+        index.refresh()
+        return index
+
+    def refresh(self) -> None:
+        self.headers = index_headers(self.lines)
+        self.by_path = {}
+        self.aot_by_path = {}
+        for h in self.headers:
+            if h.kind == "aot":
+                key = tuple(h.path)
+                self.by_path[("aot", key, h.aot_index)] = h
+                self.aot_by_path.setdefault(key, []).append(h)
+            elif h.kind == "table":
+                self.by_path[("table", tuple(h.path), None)] = h
+
+    @property
+    def root(self) -> Header:
+        return self.headers[0]  # index_headers always emits root first
+
+    def splice(self, start: int, end: int, new_lines: List[str]) -> None:
+        """
+        Replace lines[start..end] (inclusive) with new_lines and shift the
+        cached headers by the resulting line delta. Only valid for edits that
+        do not add or remove section headers; header-changing edits must call
+        refresh() instead.
+        """
+        # In-place slice assignment moves the tail once in C instead of
+        # rebuilding the whole list per patch.
+        self.lines[start : end + 1] = new_lines
+        delta = len(new_lines) - (end - start + 1)
+        if delta == 0:
+            return
+        for h in self.headers:
+            if h.start_line > end:
+                h.start_line += delta
+            if h.end_line >= end:
+                h.end_line += delta
+        if delta < 0:
+            # A shrinking edit can leave a section's cached end_line on
+            # standalone comment/blank lines (e.g. deleting its last
+            # assignment); re-trim to keep the index_headers invariant that
+            # end_line excludes them.
+            for h in self.headers:
+                if h.kind == "root":
+                    continue
+                while h.end_line > h.start_line and _is_comment_or_blank(self.lines[h.end_line]):
+                    h.end_line -= 1
+
+
+def _segments_key(segs: List[PathSegment]) -> Tuple[Tuple[str, Optional[int]], ...]:
+    return tuple(s._key for s in segs)
 
 
 def find_section_block(
-    headers: List[Header], target: List[PathSegment]
+    index: HeaderIndex, target: Tuple[PathSegment, ...]
 ) -> Tuple[Header, int, int]:
     """
     Find a section block (start,end) lines that correspond to the given path segments.
     """
     if not target:
-        for h in headers:
-            if h.kind == "root":
-                return h, h.start_line + 1, h.end_line
-        raise RuntimeError("root header missing")
+        h = index.root
+        return h, h.start_line + 1, h.end_line
 
+    table_path = tuple(t.name for t in target)
     if target[-1].index is not None:
-        table_path = [t.name for t in target[:-1]] + [target[-1].name]
-        wanted_idx = target[-1].index
-        candidates = [
-            h for h in headers if h.kind == "aot" and h.path == table_path and h.aot_index == wanted_idx
-        ]
-        if not candidates:
+        h = index.by_path.get(("aot", table_path, target[-1].index))
+        if h is None:
             raise KeyError("section not found")
-        h = candidates[0]
         return h, h.start_line + 1, h.end_line
     else:
-        table_path = [t.name for t in target]
-        candidates = [h for h in headers if h.kind == "table" and h.path == table_path]
-        if candidates:
-            h = candidates[0]
+        h = index.by_path.get(("table", table_path, None))
+        if h is not None:
             return h, h.start_line + 1, h.end_line
-        aot_candidates = [h for h in headers if h.kind == "aot" and h.path == table_path]
+        aot_candidates = index.aot_by_path.get(table_path, [])
         if len(aot_candidates) == 0:
             raise KeyError("section not found")
         if len(aot_candidates) > 1:
@@ -429,27 +552,31 @@ def _parse_assignment_key_segments(lhs: str) -> Optional[List[str]]:
     lhs = lhs.strip()
     if not lhs or lhs.startswith("#"):
         return None
-    toks = _split_path_tokens(lhs)
-    return [_unquote_key(t) for t in toks]
+    return [_unquote_key(tok) for tok, _idx in _split_path_tokens(lhs)]
 
 
 def _find_equals_outside_quotes(line: str) -> int:
-    in_dq = in_sq = False
     i = 0
     while i < len(line):
         ch = line[i]
-        if ch == '"' and not in_sq:
+        if ch == '"':
             if i > 0 and line[i - 1] == "\\":
                 i += 1
                 continue
-            in_dq = not in_dq
-            i += 1
+            j = line.find('"', i + 1)
+            while j != -1 and line[j - 1] == "\\":
+                j = line.find('"', j + 1)
+            if j == -1:
+                return -1
+            i = j + 1
             continue
-        if ch == "'" and not in_dq:
-            in_sq = not in_sq
-            i += 1
+        if ch == "'":
+            j = line.find("'", i + 1)
+            if j == -1:
+                return -1
+            i = j + 1
             continue
-        if ch == "=" and not in_dq and not in_sq:
+        if ch == "=":
             return i
         i += 1
     return -1
@@ -459,91 +586,216 @@ TRIPLE_DQ = '"' * 3
 TRIPLE_SQ = "'" * 3
 
 
-def _value_block_end(lines: List[str], start_line: int, start_col: int) -> int:
+def _value_block_end(lines: List[str], start_line: int, start_col: int, cache: Optional[dict] = None) -> int:
     """
     Determine inclusive end line index of a value that starts on start_line at start_col (right after '=').
     Handles multi-line arrays, inline tables, and multi-line strings.
-    """
-    i = start_line
-    depth_square = 0
-    depth_curly = 0
-    in_dq = False
-    in_sq = False
-    in_triple_dq = False
-    in_triple_sq = False
-
-    def advance_line_text(i: int) -> str:
-        return lines[i][start_col:] if i == start_line else lines[i]
 
-    while i < len(lines):
-        text = advance_line_text(i)
-        j = 0
-        while j < len(text):
-            ch = text[j]
-            nxt3 = text[j : j + 3]
+    cache, when provided, holds the encoded document buffer across calls in
+    one scan pass (only used by the compiled scanner).
+    """
+    if _np is not None:
+        if cache is not None and "buf" in cache:
+            buf, line_starts = cache["buf"]
+        else:
+            buf, line_starts = _build_scan_buffer(lines)
+            if cache is not None:
+                cache["buf"] = (buf, line_starts)
+        start_byte = int(line_starts[start_line]) + len(lines[start_line][:start_col].encode("utf-8"))
+        end_byte = int(_scan_value_end(buf, start_byte))
+        # Map the byte offset back through the per-line byte starts; lines
+        # split on non-\n terminators (U+2028 etc. inside strings) are
+        # accounted for, unlike a plain newline count.
+        line = int(_np.searchsorted(line_starts, end_byte, side="right")) - 1
+        return min(line, len(lines) - 1)
+    return _value_block_end_py(lines, start_line, start_col)
+
+
+if _np is not None:
+    def _build_scan_buffer(lines: List[str]):
+        # Whole-document byte buffer plus line_starts (len(lines) + 1 entries,
+        # last one == total byte length) for offset <-> line conversion.
+        buf = _np.frombuffer("".join(lines).encode("utf-8"), dtype=_np.uint8)
+        lens = _np.fromiter(
+            (len(l.encode("utf-8")) for l in lines), dtype=_np.int64, count=len(lines)
+        )
+        line_starts = _np.zeros(len(lines) + 1, dtype=_np.int64)
+        _np.cumsum(lens, out=line_starts[1:])
+        return buf, line_starts
+
+    @_njit(cache=True)
+    def _scan_value_end(buf, start):
+        # Byte-level mirror of _value_block_end_py over the document buffer;
+        # returns the byte offset where the value ends (the terminating
+        # newline or '#', or len(buf) when it runs off the end). ASCII byte
+        # compares are safe: UTF-8 continuation bytes never collide with the
+        # structural characters tested here.
+        n = buf.shape[0]
+        depth_square = 0
+        depth_curly = 0
+        in_dq = False
+        in_sq = False
+        in_triple_dq = False
+        in_triple_sq = False
+        j = start
+        while j < n:
+            ch = buf[j]
             if in_triple_dq:
-                if nxt3 == TRIPLE_DQ:
+                if ch == 34 and j + 2 < n and buf[j + 1] == 34 and buf[j + 2] == 34:
                     in_triple_dq = False
                     j += 3
                     continue
                 j += 1
                 continue
             if in_triple_sq:
-                if nxt3 == TRIPLE_SQ:
+                if ch == 39 and j + 2 < n and buf[j + 1] == 39 and buf[j + 2] == 39:
                     in_triple_sq = False
                     j += 3
                     continue
                 j += 1
                 continue
             if in_dq:
-                if ch == "\\":
+                if ch == 92:
                     j += 2
                     continue
-                if ch == '"':
+                if ch == 34:
                     in_dq = False
                 j += 1
                 continue
             if in_sq:
-                if ch == "'":
+                if ch == 39:
                     in_sq = False
                 j += 1
                 continue
             # not in any string
-            if nxt3 == TRIPLE_DQ:
-                in_triple_dq = True
-                j += 3
+            if ch == 10:
+                if depth_square == 0 and depth_curly == 0:
+                    return j
+                j += 1
+                continue
+            if ch == 34:
+                if j + 2 < n and buf[j + 1] == 34 and buf[j + 2] == 34:
+                    in_triple_dq = True
+                    j += 3
+                else:
+                    in_dq = True
+                    j += 1
+                continue
+            if ch == 39:
+                if j + 2 < n and buf[j + 1] == 39 and buf[j + 2] == 39:
+                    in_triple_sq = True
+                    j += 3
+                else:
+                    in_sq = True
+                    j += 1
+                continue
+            if ch == 91:
+                depth_square += 1
+            elif ch == 93:
+                if depth_square > 0:
+                    depth_square -= 1
+            elif ch == 123:
+                depth_curly += 1
+            elif ch == 125:
+                if depth_curly > 0:
+                    depth_curly -= 1
+            elif ch == 35:
+                if depth_square == 0 and depth_curly == 0:
+                    # Inline comment starts; end of value on this line
+                    return j
+            j += 1
+        return n
+
+
+# Next structural character outside any string, and next escape/close inside a
+# basic string — compiled once so the scanner jumps between interesting
+# characters with C-level searches instead of stepping per character.
+_VB_STRUCT_RE = re.compile(r"[\"'\[\]{}#]")
+_VB_BASIC_RE = re.compile(r'[\\"]')
+
+
+def _value_block_end_py(lines: List[str], start_line: int, start_col: int) -> int:
+    i = start_line
+    depth_square = 0
+    depth_curly = 0
+    in_dq = False
+    in_sq = False
+    in_triple_dq = False
+    in_triple_sq = False
+
+    def advance_line_text(i: int) -> str:
+        return lines[i][start_col:] if i == start_line else lines[i]
+
+    while i < len(lines):
+        text = advance_line_text(i)
+        j = 0
+        n = len(text)
+        while j < n:
+            if in_triple_dq:
+                p = text.find(TRIPLE_DQ, j)
+                if p == -1:
+                    break
+                in_triple_dq = False
+                j = p + 3
+                continue
+            if in_triple_sq:
+                p = text.find(TRIPLE_SQ, j)
+                if p == -1:
+                    break
+                in_triple_sq = False
+                j = p + 3
+                continue
+            if in_dq:
+                m = _VB_BASIC_RE.search(text, j)
+                if m is None:
+                    break
+                j = m.start()
+                if text[j] == "\\":
+                    j += 2
+                else:
+                    in_dq = False
+                    j += 1
                 continue
-            if nxt3 == TRIPLE_SQ:
-                in_triple_sq = True
-                j += 3
+            if in_sq:
+                p = text.find("'", j)
+                if p == -1:
+                    break
+                in_sq = False
+                j = p + 1
                 continue
+            # not in any string: jump to the next structural character
+            m = _VB_STRUCT_RE.search(text, j)
+            if m is None:
+                break
+            j = m.start()
+            ch = text[j]
             if ch == '"':
-                in_dq = True
-                j += 1
+                if text[j : j + 3] == TRIPLE_DQ:
+                    in_triple_dq = True
+                    j += 3
+                else:
+                    in_dq = True
+                    j += 1
                 continue
             if ch == "'":
-                in_sq = True
-                j += 1
+                if text[j : j + 3] == TRIPLE_SQ:
+                    in_triple_sq = True
+                    j += 3
+                else:
+                    in_sq = True
+                    j += 1
                 continue
             if ch == "[":
                 depth_square += 1
-                j += 1
-                continue
-            if ch == "]":
+            elif ch == "]":
                 if depth_square > 0:
                     depth_square -= 1
-                j += 1
-                continue
-            if ch == "{":
+            elif ch == "{":
                 depth_curly += 1
-                j += 1
-                continue
-            if ch == "}":
+            elif ch == "}":
                 if depth_curly > 0:
                     depth_curly -= 1
-                j += 1
-                continue
-            if ch == "#" and depth_square == 0 and depth_curly == 0:
+            elif ch == "#" and depth_square == 0 and depth_curly == 0:
                 # Inline comment starts; end of value on this line
                 return i
             j += 1
@@ -554,49 +806,75 @@ def _value_block_end(lines: List[str], start_line: int, start_col: int) -> int:
     return len(lines) - 1
 
 
+def _scan_section_assignments(
+    index: HeaderIndex, header: Header, start: int, end: int, wanted
+) -> dict:
+    """
+    Walk one section block and collect the assignment blocks whose full path
+    key appears in wanted (a set of _segments_key tuples). Returns
+    {full_path_key: [(start_line, end_line, ksegs), ...]} so any number of
+    patches against the section cost a single pass over its lines.
+    """
+    lines = index.lines
+    header_key = header.id_keys
+    last_names = {key[-1][0] for key in wanted}
+    found: dict = {}
+    scan_cache: dict = {}  # one encoded buffer per pass for the compiled scanner
+    i = max(start, 0)
+    while i <= end and i < len(lines):
+        line = lines[i]
+        k = _first_nonspace(line)
+        if k >= len(line) or line[k] in "#[\r\n":
+            i += 1
+            continue
+        eq_pos = _find_equals_outside_quotes(line)
+        if eq_pos == -1:
+            i += 1
+            continue
+        lhs = line[:eq_pos].strip()
+        if _BARE_KEY_RE.match(lhs):
+            # Fast path: bare single-segment key, the overwhelmingly common
+            # case — compare directly without tokenizing the LHS.
+            if lhs not in last_names:
+                i += 1
+                continue
+            ksegs = [lhs]
+        else:
+            ksegs = _parse_assignment_key_segments(lhs)
+            if not ksegs:
+                i += 1
+                continue
+        full_key = header_key + tuple((n, None) for n in ksegs)
+        if full_key in wanted:
+            end_block = _value_block_end(lines, i, eq_pos + 1, scan_cache)
+            found.setdefault(full_key, []).append((i, end_block, ksegs))
+        i += 1
+    return found
+
+
 def find_assignment_block_by_full_path(
-    lines: List[str], headers: List[Header], full_path: List[PathSegment]
+    index: HeaderIndex, full_path: Tuple[PathSegment, ...]
 ) -> Tuple[int, int, List[str]]:
     if not full_path:
         raise KeyError("invalid empty path")
-    table_path: List[PathSegment] = full_path[:-1]
-    key_path: List[str] = [full_path[-1].name]
+    table_path: Tuple[PathSegment, ...] = full_path[:-1]
 
     try:
-        header, start, end = find_section_block(headers, table_path)
+        header, start, end = find_section_block(index, table_path)
     except KeyError:
         raise KeyError("section not found")
     except RuntimeError:
         raise RuntimeError("ambiguous")
 
-    matches: List[Tuple[int, int, List[str]]] = []
-    i = max(start, 0)
-    while i <= end and i < len(lines):
-        line = lines[i]
-        stripped = line.lstrip()
-        if not stripped or stripped.startswith("#") or stripped.startswith("["):
-            i += 1
-            continue
-        eq_pos = _find_equals_outside_quotes(line)
-        if eq_pos == -1:
-            i += 1
-            continue
-        lhs = line[:eq_pos]
-        ksegs = _parse_assignment_key_segments(lhs)
-        if not ksegs:
-            i += 1
-            continue
-        full_key = header.id_segments() + [PathSegment(n) for n in ksegs]
-        if _segments_equal(full_key, full_path):
-            end_block = _value_block_end(lines, i, eq_pos + 1)
-            matches.append((i, end_block, ksegs))
-        i += 1
+    full_path_key = _segments_key(full_path)
+    matches = _scan_section_assignments(
+        index, header, start, end, {full_path_key}
+    ).get(full_path_key, [])
 
     if not matches:
         if table_path and table_path[-1].index is None:
-            tp = [t.name for t in table_path]
-            aot_candidates = [h for h in headers if h.kind == "aot" and h.path == tp]
-            if len(aot_candidates) > 1:
+            tp = tuple(t.name for t in table_path)
+            if len(index.aot_by_path.get(tp, [])) > 1:
                 raise RuntimeError("ambiguous")
         raise KeyError("key not found")
 
@@ -608,83 +886,138 @@ def find_assignment_block_by_full_path(
 # ---- Top-of-file comment replacement ----------------------------------------
 
 def replace_top_comment_block(text: str, new_text: str) -> str:
-    lines = text.splitlines(keepends=True)
-    i = 0
-    while i < len(lines):
-        s = lines[i].strip()
-        if s == "" or s.startswith("#"):
-            i += 1
-            continue
-        break
-    new_lines: List[str] = []
+    # Locate the first line that is neither blank nor a comment by offset,
+    # without splitting the whole document into a line list.
+    offset = 0
+    n = len(text)
+    while offset < n:
+        eol = text.find("\n", offset)
+        end = n if eol == -1 else eol
+        k = offset
+        while k < end and text[k] in " \t":
+            k += 1
+        if k < end and text[k] not in "#\r":
+            break
+        offset = n if eol == -1 else eol + 1
+    parts: List[str] = []
     if new_text is not None:
         for raw_line in new_text.splitlines():
             if raw_line.strip() == "":
-                new_lines.append("#\n")
+                parts.append("#\n")
             else:
-                new_lines.append("# " + raw_line.rstrip() + "\n")
-        new_lines.append("\n")
-    return "".join(new_lines + lines[i:])
+                parts.append("# " + raw_line.rstrip() + "\n")
+        parts.append("\n")
+    parts.append(text[offset:])
+    return "".join(parts)
 
 
 # ---- Patching operations -----------------------------------------------------
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class SetPatch:
-    path: List[PathSegment]
+    path: Tuple[PathSegment, ...]
     value_src: str
     value_obj: object
     comment: Optional[str]
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class DeleteKeyPatch:
-    path: List[PathSegment]
+    path: Tuple[PathSegment, ...]
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class DeleteSectionPatch:
-    path: List[PathSegment]
-
-
-def apply_set(lines: List[str], setp: SetPatch) -> List[str]:
-    headers = index_headers(lines)
-    try:
-        start, end, ksegs = find_assignment_block_by_full_path(lines, headers, setp.path)
-    except KeyError:
-        print("error: requested path not found", file=sys.stderr)
-        sys.exit(2)
-    except RuntimeError:
-        print("error: ambiguous path", file=sys.stderr)
-        sys.exit(3)
-
-    lhs = ".".join(_format_key_segment(s) for s in ksegs)
-    rhs = format_toml_value(setp.value_obj)
-    if setp.comment is not None and setp.comment != "":
-        new_line = f"{lhs} = {rhs} # {setp.comment}\n"
-    else:
-        new_line = f"{lhs} = {rhs}\n"
+    path: Tuple[PathSegment, ...]
 
-    return lines[:start] + [new_line] + lines[end + 1 :]
 
-
-def apply_delete_key(lines: List[str], delp: DeleteKeyPatch) -> List[str]:
-    headers = index_headers(lines)
+def _locate_section_patches(
+    index: HeaderIndex, section_path: Tuple[PathSegment, ...], paths: List[Tuple[PathSegment, ...]]
+) -> dict:
+    """
+    Resolve the assignment block of every patch path (all targeting the same
+    section) with one walk of the section. Returns {full_path_key: (start,
+    end, ksegs)}; exits with the usual diagnostics when a path is missing or
+    ambiguous.
+    """
+    for path in paths:
+        if not path:
+            print("error: requested path not found", file=sys.stderr)
+            sys.exit(2)
     try:
-        start, end, _ksegs = find_assignment_block_by_full_path(lines, headers, delp.path)
+        header, start, end = find_section_block(index, section_path)
     except KeyError:
         print("error: requested path not found", file=sys.stderr)
         sys.exit(2)
     except RuntimeError:
         print("error: ambiguous path", file=sys.stderr)
         sys.exit(3)
-    return lines[:start] + lines[end + 1 :]
 
-
-def apply_delete_section(lines: List[str], delsec: DeleteSectionPatch) -> List[str]:
-    headers = index_headers(lines)
+    wanted = {_segments_key(p) for p in paths}
+    found = _scan_section_assignments(index, header, start, end, wanted)
+
+    located: dict = {}
+    for key in wanted:
+        blocks = found.get(key, [])
+        if not blocks:
+            if section_path and section_path[-1].index is None:
+                tp = tuple(t.name for t in section_path)
+                if len(index.aot_by_path.get(tp, [])) > 1:
+                    print("error: ambiguous path", file=sys.stderr)
+                    sys.exit(3)
+            print("error: requested path not found", file=sys.stderr)
+            sys.exit(2)
+        if len(blocks) > 1:
+            print("error: ambiguous path", file=sys.stderr)
+            sys.exit(3)
+        located[key] = blocks[0]
+    return located
+
+
+def apply_set_many(
+    index: HeaderIndex, section_path: Tuple[PathSegment, ...], setps: List[SetPatch]
+) -> None:
+    # For the same key, the last --set wins, as with sequential application.
+    pending = {_segments_key(sp.path): sp for sp in setps}
+    located = _locate_section_patches(index, section_path, [sp.path for sp in setps])
+
+    replacements = []
+    for key, setp in pending.items():
+        start, end, ksegs = located[key]
+        lhs = ".".join(_format_key_segment(s) for s in ksegs)
+        rhs = format_toml_value(setp.value_obj)
+        if setp.comment is not None and setp.comment != "":
+            new_line = f"{lhs} = {rhs} # {setp.comment}\n"
+        else:
+            new_line = f"{lhs} = {rhs}\n"
+        replacements.append((start, end, new_line))
+
+    # Apply bottom-up so earlier block positions stay valid.
+    for start, end, new_line in sorted(replacements, reverse=True):
+        index.splice(start, end, [new_line])
+
+
+def apply_delete_keys_many(
+    index: HeaderIndex, section_path: Tuple[PathSegment, ...], delps: List[DeleteKeyPatch]
+) -> None:
+    located = _locate_section_patches(index, section_path, [dp.path for dp in delps])
+    # Sequential application deletes a key on its first --delete-key flag and
+    # then fails to find it for a repeated one; keep that contract instead of
+    # silently deduplicating.
+    seen = set()
+    for dp in delps:
+        key = _segments_key(dp.path)
+        if key in seen:
+            print("error: requested path not found", file=sys.stderr)
+            sys.exit(2)
+        seen.add(key)
+    for start, end, _ksegs in sorted(located.values(), reverse=True):
+        index.splice(start, end, [])
+
+
+def apply_delete_section(index: HeaderIndex, delsec: DeleteSectionPatch) -> None:
     try:
-        header, start, end = find_section_block(headers, delsec.path)
+        header, start, end = find_section_block(index, delsec.path)
     except KeyError:
         print("error: requested path not found", file=sys.stderr)
         sys.exit(2)
@@ -696,7 +1029,9 @@ def apply_delete_section(lines: List[str], delsec: DeleteSectionPatch) -> List[s
         sys.exit(4)
     del_start = header.start_line
     del_end = end
-    return lines[:del_start] + lines[del_end + 1 :]
+    # Removing a header invalidates header positions and aot indices.
+    del index.lines[del_start : del_end + 1]
+    index.refresh()
 
 
 # ---- CLI --------------------------------------------------------------------
@@ -739,6 +1074,13 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=None,
         help="Replace or create the top-of-file comment block (supports newlines).",
     )
+    p.add_argument(
+        "--no-validate-input",
+        dest="validate_input",
+        action="store_false",
+        help="Skip the up-front tomllib parse of the input document.\n"
+             "Saves a full parse on large files when the input is trusted.",
+    )
     return p
 
 
@@ -752,18 +1094,30 @@ def main(argv: Optional[List[str]] = None) -> int:
         print(f"error: cannot read input: {e}", file=sys.stderr)
         return 1
 
-    try:
-        validate_toml_document(text)
-    except Exception as e:
-        print(f"error: invalid input TOML: {e}", file=sys.stderr)
-        return 1
+    if args.validate_input:
+        try:
+            validate_toml_document(text)
+        except Exception as e:
+            print(f"error: invalid input TOML: {e}", file=sys.stderr)
+            return 1
 
     if args.top_comment is not None:
         text = replace_top_comment_block(text, args.top_comment)
 
     lines = text.splitlines(keepends=True)
+    index = HeaderIndex.build(lines)
 
     # Apply in simple, predictable groups: sets -> delete-key -> delete-section
+    # --set and --delete-key flags are bucketed by target section so each
+    # section is scanned once no matter how many flags touch it;
+    # --delete-section still applies one flag at a time. Within the --set
+    # group all payloads are parsed before any patch is applied, so an
+    # invalid payload (exit 4) takes precedence over a missing/ambiguous
+    # path (exit 2/3) in an earlier --set flag. Bucketing also surfaces
+    # path failures section by section rather than in flag order, so a
+    # mix of missing and ambiguous paths can exit 2 where sequential
+    # application exited 3.
+    set_buckets: dict = {}
     for spec in args.sets:
         try:
             path_str, value_src, comment = split_set_expression(spec)
@@ -773,8 +1127,11 @@ def main(argv: Optional[List[str]] = None) -> int:
             print(f"error: invalid --set payload: {e}", file=sys.stderr)
             return 4
         setp = SetPatch(path=path, value_src=value_src, value_obj=value_obj, comment=comment)
-        lines = apply_set(lines, setp)
+        set_buckets.setdefault(_segments_key(path[:-1]), (path[:-1], []))[1].append(setp)
+    for section_path, setps in set_buckets.values():
+        apply_set_many(index, section_path, setps)
 
+    del_buckets: dict = {}
     for pth in args.del_keys:
         try:
             path = parse_path_with_indices(pth)
@@ -782,7 +1139,9 @@ def main(argv: Optional[List[str]] = None) -> int:
             print(f"error: invalid --delete-key payload: {e}", file=sys.stderr)
             return 4
         delp = DeleteKeyPatch(path=path)
-        lines = apply_delete_key(lines, delp)
+        del_buckets.setdefault(_segments_key(path[:-1]), (path[:-1], []))[1].append(delp)
+    for section_path, delps in del_buckets.values():
+        apply_delete_keys_many(index, section_path, delps)
 
     for pth in args.del_secs:
         try:
@@ -791,9 +1150,9 @@ def main(argv: Optional[List[str]] = None) -> int:
             print(f"error: invalid --delete-section payload: {e}", file=sys.stderr)
             return 4
         delsec = DeleteSectionPatch(path=path)
-        lines = apply_delete_section(lines, delsec)
+        apply_delete_section(index, delsec)
 
-    out_text = "".join(lines)
+    out_text = "".join(index.lines)
 
     try:
         with open(args.output, "w", encoding="utf-8", newline="") as f:
@@ -31,6 +31,21 @@ def run_case(name, input_file, expected_file, args):
     print(f"{name}: OK")
 
 
+def run_exit_case(name, input_file, args, expected_code):
+    cmd = [
+        sys.executable,
+        "patch_toml.py",
+        input_file,
+        f"/tmp/{name}.toml",
+    ] + list(args)
+    print(f"Running: {' '.join(cmd)}")
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode != expected_code:
+        print(result.stdout)
+        raise AssertionError(f"{name}: expected exit {expected_code}, got {result.returncode}")
+    print(f"{name}: OK")
+
+
 def main():
     tests = [
         (
@@ -56,11 +71,50 @@ def main():
             "tests/01_output_change_stdout_level_to_4.toml",
             ["--set", "logger.stdout_level=4"],
         ),
+        (
+            # Batched --set flags across sections plus a --delete-key
+            "01_output_batched_sets_and_delete",
+            "tests/01_input.toml",
+            "tests/01_output_batched_sets_and_delete.toml",
+            [
+                "--set",
+                "logger.stdout_level = 1",
+                "--set",
+                "logger.file_level = 2 # quieter",
+                "--set",
+                "device.shadowing = false",
+                "--delete-key",
+                "device.some_array",
+            ],
+        ),
+        (
+            # Deleting a section after deleting its last key must not eat the
+            # standalone comment/blank lines the key deletion exposed
+            "02_output_delete_key_then_section",
+            "tests/02_input.toml",
+            "tests/02_output_delete_key_then_section.toml",
+            ["--delete-key", "a.y", "--delete-section", "a"],
+        ),
+        (
+            # --no-validate-input must not change the patched output
+            "00_output_no_validate_input",
+            "tests/00_input.toml",
+            "tests/00_output_with_int_changed_to_42.toml",
+            ["--no-validate-input", "--set", "simplest_config_possible.int_value=42"],
+        ),
     ]
 
     for test in tests:
         run_case(*test)
 
+    exit_tests = [
+        ("03_invalid_default", "tests/03_invalid_input.toml", [], 1),
+        ("03_invalid_skip_validation", "tests/03_invalid_input.toml", ["--no-validate-input"], 0),
+    ]
+
+    for test in exit_tests:
+        run_exit_case(*test)
+
 
 if __name__ == "__main__":
     try: